@@ -1,38 +1,110 @@
-from flask import Flask, render_template, request, jsonify, send_file, abort
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+from pydantic import BaseModel
+from arq import create_pool
+from arq.jobs import Job, JobStatus
 import os
-from main import process_objective
-
-app = Flask(__name__)
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/process', methods=['POST'])
-def process():
-    objective = request.form['objective']
-    file_content = request.form.get('file_content', None)
-    use_search = request.form.get('use_search', 'false') == 'true'
-
-    result = process_objective(objective, file_content, use_search)
-    
-    # Update file paths to be relative to the current working directory
-    result['log_file'] = os.path.join(result['project_name'], os.path.basename(result['log_file']))
-    result['created_files'] = [os.path.join(result['project_name'], file) for file in result['created_files']]
-    
-    return jsonify(result)
-
-@app.route('/download/<path:filename>')
-def download_file(filename):
+import json
+import stat
+from urllib.parse import quote
+from job_queue import REDIS_SETTINGS, stream_channel
+
+@asynccontextmanager
+async def lifespan(app):
+    # Projects are generated by the arq worker (arq worker.WorkerSettings); the app only queues jobs
+    app.state.redis = await create_pool(REDIS_SETTINGS)
+    yield
+    await app.state.redis.aclose()
+
+app = FastAPI(lifespan=lifespan)
+app.mount('/static', StaticFiles(directory='static'), name='static')
+templates = Jinja2Templates(directory='templates')
+
+# Behind nginx, set this to an internal location aliased to the working directory
+# (e.g. /protected/) so nginx serves downloads itself via X-Accel-Redirect
+DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX')
+
+class ProcessRequest(BaseModel):
+    objective: str
+    file_content: str | None = None
+    use_search: bool = False
+
+@app.get('/')
+async def index(request: Request):
+    return templates.TemplateResponse(request, 'index.html')
+
+@app.post('/process')
+async def process(req: ProcessRequest):
+    job = await app.state.redis.enqueue_job('run_process_objective', req.objective, req.file_content, req.use_search)
+    return {'job_id': job.job_id}
+
+@app.get('/status/{job_id}')
+async def status(job_id: str):
+    job = Job(job_id, app.state.redis)
+    job_status = await job.status()
+    if job_status == JobStatus.not_found:
+        raise HTTPException(status_code=404)
+    if job_status != JobStatus.complete:
+        return {'status': job_status.value}
+    result_info = await job.result_info()
+    if not result_info.success:
+        return {'status': 'failed', 'error': str(result_info.result)}
+    return {'status': 'complete', 'result': result_info.result}
+
+@app.get('/stream/{job_id}')
+async def stream(job_id: str):
+    async def events():
+        job = Job(job_id, app.state.redis)
+        pubsub = app.state.redis.pubsub()
+        await pubsub.subscribe(stream_channel(job_id))
+        try:
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5.0)
+                if message is None:
+                    # Nothing published for a while: stop if the job already finished,
+                    # e.g. before we subscribed
+                    if await job.status() in (JobStatus.complete, JobStatus.not_found):
+                        yield f"data: {json.dumps({'done': True})}\n\n"
+                        break
+                    continue
+                data = message['data'].decode()
+                yield f"data: {data}\n\n"
+                if json.loads(data).get('done'):
+                    break
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+@app.get('/download/{filename:path}')
+def download_file(filename: str):
+    base_dir = os.path.realpath(os.getcwd())
+    file_path = os.path.realpath(os.path.join(base_dir, filename))
+    # Only serve files inside the working directory
+    if os.path.commonpath([file_path, base_dir]) != base_dir:
+        raise HTTPException(status_code=404)
     try:
-        file_path = os.path.join(os.getcwd(), filename)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
-            abort(404)
+        file_stat = os.stat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404)
     except Exception as e:
         print(f"Error in download_file: {str(e)}")
-        abort(500)
+        raise HTTPException(status_code=500)
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise HTTPException(status_code=404)
+
+    if DOWNLOAD_ACCEL_PREFIX:
+        return Response(headers={
+            'X-Accel-Redirect': DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(os.path.relpath(file_path, base_dir)),
+            'Content-Disposition': f"attachment; filename*=utf-8''{quote(os.path.basename(file_path))}"
+        })
+    # Hand over the stat result so FileResponse doesn't stat the file again
+    return FileResponse(file_path, filename=os.path.basename(file_path), stat_result=file_stat)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run('app:app', reload=True)
@@ -0,0 +1,9 @@
+import os
+from arq.connections import RedisSettings
+
+# Shared by the web app and the worker. Kept apart from worker.py so the app can queue jobs
+# without importing the generation pipeline in main.py.
+REDIS_SETTINGS = RedisSettings.from_dsn(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+
+def stream_channel(job_id):
+    return f"project-generator:stream:{job_id}"
@@ -1,36 +1,64 @@
 import os
 import re
+import asyncio
+import contextvars
+import itertools
 from rich.console import Console
 from rich.panel import Panel
 from datetime import datetime
 import json
-from openai import OpenAI
+import aiofiles
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types import CompletionUsage
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
-from tavily import TavilyClient
 import logging
-import html5lib
-from pylint.lint import Run
-from pylint.reporters.text import TextReporter
-import esprima
-import yaml
-import css_parser
+import functools
+import hashlib
+from collections import OrderedDict
+import tempfile
 import xml.etree.ElementTree as ET
 import subprocess
-from rdflib import Graph, plugins
-from rdflib.plugin import register, Parser
-from rpy2 import robjects
 from io import StringIO
 
-# Register RDF parsers
-register('xml', Parser, 'rdflib.plugins.parsers.rdfxml', 'RDFXMLParser')
-register('turtle', Parser, 'rdflib.plugins.parsers.turtle', 'TurtleParser')
-register('nt', Parser, 'rdflib.plugins.parsers.ntriples', 'NTriplesParser')
-
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI API client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI API client on a shared HTTP/2 connection pool, reused across requests.
+# The client's own retries are disabled, stream_chat_completion retries transient errors itself.
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=200),
+    timeout=60
+)
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+
+# Transient OpenAI errors, retried with exponential backoff and jitter. A connection dropped
+# mid-stream surfaces as a raw httpx error rather than an APIConnectionError. Any other API
+# error (e.g. an invalid API key or a bad request) fails straight away.
+RETRYABLE_API_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError, httpx.TransportError)
+API_MAX_ATTEMPTS = 3
+
+# Retries after an output fails validation sample slightly hotter than OpenAI's default,
+# so the model doesn't reproduce the same invalid output
+DEFAULT_TEMPERATURE = 1.0
+RETRY_TEMPERATURE_STEP = 0.1
+
+# Cap on concurrent in-flight OpenAI calls, to stay within rate limits
+MAX_CONCURRENT_CALLS = 4
+api_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+# Optional coroutine function awaited as on_delta(stream_id, text) with every streamed text
+# delta, e.g. to forward progress to a client. Completions run concurrently, so stream_id tells
+# apart the deltas of each call; text is None when a retry discards what the call streamed so
+# far. Set it around process_objective; sub-tasks inherit it.
+stream_callback = contextvars.ContextVar('stream_callback', default=None)
+_stream_ids = itertools.count(1)
+
+# Maximum number of independent sub-tasks packed into a single sub-agent call
+SUB_TASK_BATCH_SIZE = 5
 
 # Available OpenAI models
 ORCHESTRATOR_MODEL = "gpt-4o-mini-2024-07-18"
@@ -46,63 +74,135 @@ console = Console()
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Precompiled regex patterns
+_SANITIZE_RE = re.compile(r'[^\w\-.]')
+_MULTI_UNDER_RE = re.compile(r'_+')
+_MARKDOWN_HEADER_RE = re.compile(r'^#', re.MULTILINE)
+_AI_OUTPUT_REQUIRED_RES = [re.compile(pattern, re.DOTALL | re.IGNORECASE) for pattern in (r'Project Name', r'<folder_structure>', r'Filename:')]
+_JSON_OBJECT_RE = re.compile(r'{.*}', re.DOTALL)
+_SUB_TASKS_RE = re.compile(r'<sub_tasks>(.*?)</sub_tasks>', re.DOTALL)
+_ANSWER_RE = re.compile(r'<answer (\d+)>(.*?)</answer \1>', re.DOTALL)
+_CODE_FENCE_RE = re.compile(r'^\s*```\w*\s*\n(.*?)\n\s*```\s*$', re.DOTALL)
+_REFINED_OUTPUT_RE = re.compile(
+    r'Project Name: (?P<project_name>[^\n]*)'
+    r'|<folder_structure>(?P<folder_structure>.*?)</folder_structure>'
+    r'|Filename:\s*`?(?P<filename>\S+)`?\s*```(?P<language>\w*)\n(?P<content>.*?)\n```',
+    re.DOTALL
+)
+
 def sanitize_filename(filename):
     # Remove any characters that aren't alphanumeric, underscore, hyphen, or period
-    sanitized = re.sub(r'[^\w\-.]', '_', filename)
+    sanitized = _SANITIZE_RE.sub('_', filename)
     # Remove leading and trailing underscores
     sanitized = sanitized.strip('_')
     # Replace multiple consecutive underscores with a single one
-    sanitized = re.sub(r'_+', '_', sanitized)
+    sanitized = _MULTI_UNDER_RE.sub('_', sanitized)
     return sanitized
 
 def validate_code(filename, content):
     # For now, we'll consider all content valid
     return True
 
+def memoize_by_content_hash(maxsize=256):
+    # Like functools.lru_cache, but keyed on a 16-byte digest of the content so the
+    # cache doesn't keep whole generated files alive
+    def decorator(func):
+        cache = OrderedDict()
+
+        @functools.wraps(func)
+        def wrapper(content):
+            key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            result = func(content)
+            cache[key] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+# Validators import their parsing libraries lazily and cache results per content,
+# so the heavy imports only happen once a validator is actually used.
+VALIDATION_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=1)
+def _get_r_interpreter():
+    # Importing rpy2.robjects starts an embedded R process, so only do it on first use
+    from rpy2 import robjects
+    return robjects.r
+
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_r(content):
     try:
         # Parse the R code
-        robjects.r(content)
+        _get_r_interpreter()(content)
         return True
     except Exception as e:
         logging.error(f"R code validation error: {str(e)}")
         return False
+
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_html(content):
     try:
+        import html5lib
         html5lib.parse(content)
         return True
     except Exception as e:
         logging.error(f"HTML validation error: {str(e)}")
         return False
 
+@functools.lru_cache(maxsize=1)
+def _get_python_linter():
+    from pylint.lint import PyLinter
+    from pylint.reporters.text import TextReporter
+    linter = PyLinter()
+    linter.load_default_plugins()
+    linter.set_reporter(TextReporter(StringIO()))
+    return linter
+
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_python(content):
     try:
+        linter = _get_python_linter()
         pylint_output = StringIO()
-        reporter = TextReporter(pylint_output)
-        Run(['-'], reporter=reporter, exit=False)
+        linter.reporter.out = pylint_output
+        with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False, encoding='utf-8') as source_file:
+            source_file.write(content)
+        try:
+            linter.check([source_file.name])
+        finally:
+            os.remove(source_file.name)
         pylint_stdout = pylint_output.getvalue()
-        pylint_stderr = ""
         return True
     except Exception as e:
         logging.error(f"Python validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_javascript(content):
     try:
+        import esprima
         esprima.parseScript(content)
         return True
     except Exception as e:
         logging.error(f"JavaScript validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_css(content):
     try:
+        import css_parser
         css_parser.parseString(content)
         return True
     except Exception as e:
         logging.error(f"CSS validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_json(content):
     try:
         json.loads(content)
@@ -111,6 +211,7 @@ def validate_json(content):
         logging.error(f"JSON validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_xml(content):
     try:
         ET.fromstring(content)
@@ -119,7 +220,9 @@ def validate_xml(content):
         logging.error(f"XML validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_yaml(content):
+    import yaml
     try:
         yaml.safe_load(content)
         return True
@@ -127,7 +230,11 @@ def validate_yaml(content):
         logging.error(f"YAML validation error: {str(e)}")
         return False
 
-def validate_shell(content):
+# Shell scripts are parsed in-process with bashlex; set this to always use `bash -n`
+# instead, which is authoritative but forks a process per call
+USE_BASH_FOR_SHELL_VALIDATION = False
+
+def validate_shell_with_bash(content):
     try:
         result = subprocess.run(['bash', '-n'], input=content, text=True, capture_output=True)
         if result.returncode != 0:
@@ -138,6 +245,24 @@ def validate_shell(content):
         logging.error(f"Shell script validation error: {str(e)}")
         return False
 
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
+def validate_shell(content):
+    if not content.strip():
+        return True
+    if USE_BASH_FOR_SHELL_VALIDATION:
+        return validate_shell_with_bash(content)
+    try:
+        import bashlex
+    except ImportError:
+        return validate_shell_with_bash(content)
+    try:
+        bashlex.parse(content)
+        return True
+    except Exception:
+        # bashlex rejects or doesn't implement some valid bash (e.g. [[ ]], arrays,
+        # arithmetic for loops), so only trust it to accept and let bash confirm the rest
+        return validate_shell_with_bash(content)
+
 def validate_sql(content):
     # This is a basic check. For more robust validation, consider using a SQL parser library.
     if not content.strip().endswith(';'):
@@ -147,60 +272,150 @@ def validate_sql(content):
 
 def validate_markdown(content):
     # Markdown is very permissive, so we'll just check for some basic structure
-    if not re.search(r'^#', content, re.MULTILINE):
+    if not _MARKDOWN_HEADER_RE.search(content):
         logging.warning("Markdown validation warning: No headers found")
     return True
 
+@functools.cache
+def _get_rdf_graph():
+    from rdflib import Graph
+    from rdflib.plugin import register, Parser
+    # Register RDF parsers
+    register('xml', Parser, 'rdflib.plugins.parsers.rdfxml', 'RDFXMLParser')
+    register('turtle', Parser, 'rdflib.plugins.parsers.notation3', 'TurtleParser')
+    register('nt', Parser, 'rdflib.plugins.parsers.ntriples', 'NTriplesParser')
+    return Graph()
+
+def detect_rdf_format(content):
+    head = content.lstrip()[:200]
+    if head.startswith('<?xml') or '<rdf:RDF' in head:
+        return 'xml'
+    # Turtle is a superset of N-Triples, so anything that isn't RDF/XML goes to the Turtle parser
+    return 'turtle'
+
+@memoize_by_content_hash(maxsize=VALIDATION_CACHE_SIZE)
 def validate_rdf(content):
-    g = Graph()
+    rdf_format = detect_rdf_format(content)
     try:
-        # Try parsing as RDF/XML
-        g.parse(data=content, format='xml')
+        g = _get_rdf_graph()
+        g.remove((None, None, None))
+        g.parse(data=content, format=rdf_format)
         return True
     except Exception as e:
-        try:
-            # Try parsing as Turtle
-            g.parse(data=content, format='turtle')
-            return True
-        except Exception as e:
-            try:
-                # Try parsing as N-Triples
-                g.parse(data=content, format='nt')
-                return True
-            except Exception as e:
-                logging.error(f"RDF validation error: {str(e)}")
-                return False
-
-def retry_ai_call(func, max_retries=3, *args, **kwargs):
+        logging.error(f"RDF validation error ({rdf_format}): {str(e)}")
+        return False
+
+async def retry_ai_call(func, max_retries=3, *args, **kwargs):
+    usable_result = None
     for attempt in range(max_retries):
+        temperature = DEFAULT_TEMPERATURE + RETRY_TEMPERATURE_STEP * attempt if attempt else None
         try:
-            result = func(*args, **kwargs)
+            result = await func(*args, temperature=temperature, **kwargs)
             logging.debug(f"AI output (attempt {attempt + 1}):\n{result}")
-            if validate_ai_output(result):
+            if not validate_ai_output(result):
+                logging.error(f"AI output validation failed (attempt {attempt + 1})")
+            elif validate_refined_structure(result):
                 return result
             else:
-                logging.error(f"AI output validation failed (attempt {attempt + 1})")
+                # Usable as is, but worth another try for a proper folder structure and code blocks
+                usable_result = result
+                logging.error(f"AI output structure validation failed (attempt {attempt + 1})")
+        except (openai.APIError, *RETRYABLE_API_ERRORS) as e:
+            # Transient errors were already retried with backoff, calling again won't help
+            logging.error(f"AI call failed (attempt {attempt + 1}): {str(e)}")
+            raise
         except Exception as e:
             logging.error(f"AI call failed (attempt {attempt + 1}): {str(e)}")
+    if usable_result is not None:
+        logging.warning("Using the last AI output despite its invalid structure")
+        return usable_result
     raise Exception("Max retries reached for AI call")
 
+@memoize_by_content_hash(maxsize=256)
 def validate_ai_output(output):
-    required_patterns = [
-        r'Project Name',
-        r'<folder_structure>',
-        r'Filename:'
-    ]
-    for pattern in required_patterns:
-        if not re.search(pattern, output, re.DOTALL | re.IGNORECASE):
-            logging.error(f"Validation failed for pattern: {pattern}")
+    for pattern in _AI_OUTPUT_REQUIRED_RES:
+        if not pattern.search(output):
+            logging.error(f"Validation failed for pattern: {pattern.pattern}")
             logging.debug(f"Output: {output}")
             return False
     logging.info("AI output validation passed")
     return True
 
-def gpt_orchestrator(objective, file_content=None, previous_results=None, use_search=False):
+@memoize_by_content_hash(maxsize=256)
+def validate_refined_structure(output):
+    # The markers alone always pass, as anthropic_refine adds any missing ones; check that
+    # the folder structure and code blocks can actually be used
+    _, folder_structure_text, code_blocks = parse_refined_output(output)
+    try:
+        folder_structure = load_folder_structure(folder_structure_text) if folder_structure_text is not None else None
+    except json.JSONDecodeError as e:
+        logging.error(f"Invalid folder structure JSON: {str(e)}")
+        return False
+    if not isinstance(folder_structure, dict):
+        logging.error("Folder structure is not a JSON object")
+        return False
+    if not code_blocks:
+        logging.error("No complete code blocks")
+        return False
+    return True
+
+def load_folder_structure(folder_structure_text):
+    # Models often wrap the JSON in a ```json fence inside the tags
+    fence_match = _CODE_FENCE_RE.match(folder_structure_text)
+    if fence_match:
+        folder_structure_text = fence_match.group(1)
+    return json.loads(folder_structure_text)
+
+def _log_api_retry(retry_state):
+    logging.warning(f"OpenAI call failed (attempt {retry_state.attempt_number}): {str(retry_state.outcome.exception())}. Retrying in {retry_state.next_action.sleep:.1f}s")
+
+async def _stream_chat_completion_attempt(model, messages, max_tokens, temperature, stream_id, on_delta):
+    chunks = []
+    usage = None
+    async with api_semaphore:
+        stream = await aclient.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=openai.NOT_GIVEN if temperature is None else temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+                if on_delta:
+                    await on_delta(stream_id, chunk.choices[0].delta.content)
+            if chunk.usage:
+                usage = chunk.usage
+    return "".join(chunks), usage
+
+async def stream_chat_completion(model, messages, max_tokens=4096, temperature=None):
+    on_delta = stream_callback.get()
+    stream_id = next(_stream_ids)
+    async for attempt in AsyncRetrying(
+        wait=wait_random_exponential(multiplier=1, min=1, max=30),
+        stop=stop_after_attempt(API_MAX_ATTEMPTS),
+        retry=retry_if_exception_type(RETRYABLE_API_ERRORS),
+        before_sleep=_log_api_retry,
+        reraise=True
+    ):
+        with attempt:
+            if on_delta and attempt.retry_state.attempt_number > 1:
+                await on_delta(stream_id, None)  # drop the partial text of the failed attempt
+            response_text, usage = await _stream_chat_completion_attempt(model, messages, max_tokens, temperature, stream_id, on_delta)
+    if on_delta and response_text:
+        await on_delta(stream_id, "\n\n")
+    if usage is None:
+        # The stream ended without its final usage chunk; report zero tokens rather than crash callers
+        logging.warning("No token usage reported for the streamed completion")
+        usage = CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    return response_text, usage
+
+async def gpt_orchestrator(objective, file_content=None, previous_results=None, use_search=False):
     console.print(f"\n[bold]Calling Orchestrator for your objective[/bold]")
     previous_results_text = "\n".join(previous_results) if previous_results else "None"
+    file_content_text = f"File content:\n{file_content}" if file_content else ""
     if file_content:
         console.print(Panel(f"File content:\n{file_content}", title="[bold blue]File Content[/bold blue]", title_align="left", border_style="blue"))
     
@@ -217,6 +432,8 @@ def gpt_orchestrator(objective, file_content=None, previous_results=None, use_se
 3. Create a detailed and specific prompt for a sub-agent to execute this task.
 4. Ensure the sub-task contributes to a complete, polished, and consistent final product.
 
+If several sub-tasks can be executed independently of each other (none of them needs the result of another), you may instead list a detailed prompt for each of them (up to {SUB_TASK_BATCH_SIZE} sub-tasks) as a JSON array of strings wrapped in <sub_tasks> tags, e.g. <sub_tasks>["<prompt 1>", "<prompt 2>"]</sub_tasks>. These sub-tasks will be executed in parallel.
+
 When dealing with code tasks:
 - Provide clear specifications for the expected output, including structure and completeness.
 - Include specific instructions for a polished and professional result.
@@ -225,7 +442,7 @@ When dealing with code tasks:
 If you believe the objective has been fully achieved, begin your response with 'The task is complete:' followed by a summary of the accomplishments.
 
 Objective: {objective}
-{'File content:\n' + file_content if file_content else ''}
+{file_content_text}
 Previous sub-task results:\n{previous_results_text}
 
 Provide your response in a clear, structured format."""}
@@ -237,21 +454,14 @@ Provide your response in a clear, structured format."""}
     if use_search:
         messages.append({"role": "user", "content": "Please also generate a JSON object containing a single 'search_query' key, which represents a question that, when asked online, would yield important information for solving the subtask. The question should be specific and targeted to elicit the most relevant and helpful resources. Format your JSON like this, with no additional text before or after:\n{\"search_query\": \"<question>\"}\n"})
 
-    gpt_response = openai_client.chat.completions.create(
-        model=ORCHESTRATOR_MODEL,
-        messages=messages,
-        max_tokens=4096
-    )
-
-    response_text = gpt_response.choices[0].message.content
-    usage = gpt_response.usage
+    response_text, usage = await stream_chat_completion(ORCHESTRATOR_MODEL, messages)
 
     console.print(Panel(response_text, title=f"[bold green]gpt Orchestrator[/bold green]", title_align="left", border_style="green", subtitle="Sending task to gpt 👇"))
     console.print(f"Input Tokens: {usage.prompt_tokens}, Output Tokens: {usage.completion_tokens}, Total Tokens: {usage.total_tokens}")
 
     search_query = None
     if use_search:
-        json_match = re.search(r'{.*}', response_text, re.DOTALL)
+        json_match = _JSON_OBJECT_RE.search(_SUB_TASKS_RE.sub('', response_text))
         if json_match:
             json_string = json_match.group()
             try:
@@ -266,12 +476,40 @@ Provide your response in a clear, structured format."""}
 
     return response_text, file_content, search_query
 
-def gpt_sub_agent(prompt, search_query=None, previous_gpt_tasks=None, use_search=False, continuation=False):
-    if previous_gpt_tasks is None:
-        previous_gpt_tasks = []
-
-    continuation_prompt = "Continuing from the previous answer, please complete the response, maintaining consistency with the original task and format."
-    system_message = """You are a specialized AI agent tasked with executing specific sub-tasks within a larger project. Your role is to:
+def extract_sub_tasks(orchestrator_output):
+    sub_tasks_match = _SUB_TASKS_RE.search(orchestrator_output)
+    if sub_tasks_match:
+        try:
+            sub_tasks = json.loads(sub_tasks_match.group(1))
+            if isinstance(sub_tasks, list) and sub_tasks and all(isinstance(task, str) for task in sub_tasks):
+                return sub_tasks
+        except json.JSONDecodeError as e:
+            logging.error(f"Invalid sub-tasks JSON: {str(e)}")
+    return [orchestrator_output]
+
+@functools.lru_cache(maxsize=1)
+def _get_tavily_client():
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+# Search answers by normalized query, shared across requests so retries don't search again
+QNA_CACHE_SIZE = 1024
+_qna_cache = OrderedDict()
+
+async def tavily_qna_search(query):
+    cache_key = " ".join(query.lower().split())
+    if cache_key in _qna_cache:
+        _qna_cache.move_to_end(cache_key)
+        qna_response = _qna_cache[cache_key]
+    else:
+        qna_response = await _get_tavily_client().qna_search(query=query)
+        _qna_cache[cache_key] = qna_response
+        if len(_qna_cache) > QNA_CACHE_SIZE:
+            _qna_cache.popitem(last=False)
+    console.print(f"QnA response: {qna_response}", style="yellow")
+    return qna_response
+
+SUB_AGENT_SYSTEM_PROMPT = """You are a specialized AI agent tasked with executing specific sub-tasks within a larger project. Your role is to:
 
 1. Carefully analyze the given prompt and any provided context.
 2. Execute the task with high attention to detail, accuracy, and completeness.
@@ -283,46 +521,95 @@ def gpt_sub_agent(prompt, search_query=None, previous_gpt_tasks=None, use_search
 5. Ensure your output is complete, polished, and consistent with the overall project objectives.
 6. If the task involves multiple steps, number them for clarity and ensure all steps are completed.
 
-Previous tasks and their results:
-""" + "\n".join(f"Task: {task['task']}\nResult: {task['result']}" for task in previous_gpt_tasks)
+The previous tasks of the project and their results are given as the earlier turns of this conversation."""
+
+def build_sub_agent_messages(previous_gpt_tasks):
+    # The system prompt never changes and previous tasks only ever get appended, so every call
+    # shares the longest possible prefix with the calls before it and hits OpenAI's prompt cache
+    messages = [{"role": "system", "content": SUB_AGENT_SYSTEM_PROMPT}]
+    for task in previous_gpt_tasks:
+        messages.append({"role": "user", "content": task['task']})
+        messages.append({"role": "assistant", "content": task['result']})
+    return messages
+
+async def gpt_sub_agent(prompt, search_task=None, previous_gpt_tasks=None, continuation=False, file_content=None):
+    if previous_gpt_tasks is None:
+        previous_gpt_tasks = []
+
+    continuation_prompt = "Continuing from the previous answer, please complete the response, maintaining consistency with the original task and format."
 
     if continuation:
         prompt = continuation_prompt
 
-    qna_response = None
-    if search_query and use_search:
-        tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        qna_response = tavily.qna_search(query=search_query)
-        console.print(f"QnA response: {qna_response}", style="yellow")
+    qna_response = await search_task if search_task else None
 
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": prompt}
-    ]
+    messages = build_sub_agent_messages(previous_gpt_tasks)
+    if file_content and not continuation:
+        messages.append({"role": "user", "content": f"File content:\n{file_content}"})
+    messages.append({"role": "user", "content": prompt})
 
     if qna_response:
         messages.append({"role": "user", "content": f"\nSearch Results:\n{qna_response}"})
 
-    gpt_response = openai_client.chat.completions.create(
-        model=SUB_AGENT_MODEL,
-        messages=messages,
-        max_tokens=4096
-    )
-
-    response_text = gpt_response.choices[0].message.content
-    usage = gpt_response.usage
+    response_text, usage = await stream_chat_completion(SUB_AGENT_MODEL, messages)
 
     console.print(Panel(response_text, title="[bold blue]gpt Sub-agent Result[/bold blue]", title_align="left", border_style="blue", subtitle="Task completed, sending result to gpt 👇"))
     console.print(f"Input Tokens: {usage.prompt_tokens}, Output Tokens: {usage.completion_tokens}, Total Tokens: {usage.total_tokens}")
 
     if usage.completion_tokens >= 4000:  # Threshold set to 4000 as a precaution
         console.print("[bold yellow]Warning:[/bold yellow] Output may be truncated. Attempting to continue the response.")
-        continuation_response_text = gpt_sub_agent(prompt, search_query, previous_gpt_tasks, use_search, continuation=True)
+        continuation_response_text = await gpt_sub_agent(prompt, search_task, previous_gpt_tasks, continuation=True)
         response_text += continuation_response_text
 
     return response_text
 
-def anthropic_refine(objective, sub_task_results, filename, projectname, continuation=False):
+async def gpt_sub_agent_batch(prompts, search_task=None, previous_gpt_tasks=None, file_content=None):
+    if len(prompts) == 1:
+        return [await gpt_sub_agent(prompts[0], search_task, previous_gpt_tasks, file_content=file_content)]
+    if previous_gpt_tasks is None:
+        previous_gpt_tasks = []
+
+    tasks_text = "\n\n".join(f"<task {i}>\n{prompt}\n</task {i}>" for i, prompt in enumerate(prompts, start=1))
+    answers_template = "\n".join(f"<answer {i}>\n...\n</answer {i}>" for i in range(1, len(prompts) + 1))
+    batch_prompt = f"""Execute each of the following {len(prompts)} independent tasks.
+
+{tasks_text}
+
+Answer every task completely, using exactly this format with no additional text before or after:
+<answers>
+{answers_template}
+</answers>"""
+
+    qna_response = await search_task if search_task else None
+
+    messages = build_sub_agent_messages(previous_gpt_tasks)
+    # The file is sent once for the whole batch rather than with every task
+    if file_content:
+        messages.append({"role": "user", "content": f"File content:\n{file_content}"})
+    messages.append({"role": "user", "content": batch_prompt})
+
+    if qna_response:
+        messages.append({"role": "user", "content": f"\nSearch Results:\n{qna_response}"})
+
+    response_text, usage = await stream_chat_completion(SUB_AGENT_MODEL, messages)
+
+    console.print(Panel(response_text, title=f"[bold blue]gpt Sub-agent Batch Result ({len(prompts)} tasks)[/bold blue]", title_align="left", border_style="blue", subtitle="Tasks completed, sending results to gpt 👇"))
+    console.print(f"Input Tokens: {usage.prompt_tokens}, Output Tokens: {usage.completion_tokens}, Total Tokens: {usage.total_tokens}")
+
+    answers = {int(number): answer.strip() for number, answer in _ANSWER_RE.findall(response_text)}
+    results = [answers.get(i) for i in range(1, len(prompts) + 1)]
+
+    # Answers missing from the batch (e.g. truncated output) are retried one task per call
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        console.print(f"[bold yellow]Warning:[/bold yellow] {len(missing)} of {len(prompts)} batched answers missing. Retrying them individually.")
+        retried = await asyncio.gather(*[gpt_sub_agent(prompts[i], search_task, previous_gpt_tasks, file_content=file_content) for i in missing])
+        for i, result in zip(missing, retried):
+            results[i] = result
+
+    return results
+
+async def anthropic_refine(objective, sub_task_results, filename, projectname, continuation=False, temperature=None):
     console.print("\nCalling GPT-4 Turbo to provide the refined final output for your objective:")
     messages = [
         {"role": "system", "content": """You are an expert project finalizer and technical writer. Your task is to review and refine sub-task results into a cohesive, complete, and polished final output. You should:
@@ -353,13 +640,8 @@ For coding projects, provide the following:
 Ensure your response is well-structured, clear, and directly addresses the original objective."""}
     ]
 
-    gpt_response = openai_client.chat.completions.create(
-        model=REFINER_MODEL,
-        messages=messages,
-        max_tokens=4096
-    )
-
-    response_text = gpt_response.choices[0].message.content.strip()
+    response_text, usage = await stream_chat_completion(REFINER_MODEL, messages, temperature=temperature)
+    response_text = response_text.strip()
     logging.debug(f"Raw anthropic_refine output:\n{response_text}")
 
     # Ensure the response contains the required sections
@@ -372,109 +654,169 @@ Ensure your response is well-structured, clear, and directly addresses the origi
 
     logging.debug(f"Processed anthropic_refine output:\n{response_text}")
 
-    usage = gpt_response.usage
     console.print(f"Input Tokens: {usage.prompt_tokens}, Output Tokens: {usage.completion_tokens}")
 
     if usage.completion_tokens >= 4000 and not continuation:  # Threshold set to 4000 as a precaution
         console.print("[bold yellow]Warning:[/bold yellow] Output may be truncated. Attempting to continue the response.")
-        continuation_response_text = anthropic_refine(objective, sub_task_results + [response_text], filename, projectname, continuation=True)
+        continuation_response_text = await anthropic_refine(objective, sub_task_results + [response_text], filename, projectname, continuation=True, temperature=temperature)
         response_text += "\n" + continuation_response_text
 
     console.print(Panel(response_text, title="[bold green]Final Output[/bold green]", title_align="left", border_style="green"))
     return response_text
 
-def validate_folder_structure(base_path, structure, current_path=''):
+def flatten_folder_structure(structure, base_path, dirs, files):
     for name, content in structure.items():
-        path = os.path.join(current_path, name)
-        full_path = os.path.join(base_path, path)
+        path = os.path.normpath(os.path.join(base_path, name))
         if content is None:  # It's a file
-            if not os.path.isfile(full_path):
-                logging.warning(f"Expected file not found: {path}")
+            files.append(path)
         else:  # It's a directory
-            if not os.path.isdir(full_path):
-                logging.warning(f"Expected directory not found: {path}")
-            else:
-                validate_folder_structure(base_path, content, path)
+            dirs.append(path)
+            flatten_folder_structure(content, path, dirs, files)
 
-def process_objective(objective, file_content, use_search):
+def validate_folder_structure(base_path, structure):
+    dirs, files = [], []
+    flatten_folder_structure(structure, base_path, dirs, files)
+
+    # List each parent directory once instead of stat-ing every expected path
+    entries = {}
+    for parent in {os.path.dirname(path) for path in dirs + files}:
+        try:
+            with os.scandir(parent) as it:
+                entries[parent] = {entry.name: entry for entry in it}
+        except OSError:
+            entries[parent] = {}
+
+    dir_set = set(dirs)
+    missing_dirs = set()
+    for path in sorted(dirs + files):  # parents sort before their contents
+        parent, name = os.path.split(path)
+        if parent in missing_dirs:
+            # Contents of a missing directory are not reported separately
+            if path in dir_set:
+                missing_dirs.add(path)
+            continue
+        entry = entries[parent].get(name)
+        if path in dir_set:
+            if entry is None or not entry.is_dir():
+                logging.warning(f"Expected directory not found: {os.path.relpath(path, base_path)}")
+                missing_dirs.add(path)
+        elif entry is None or not entry.is_file():
+            logging.warning(f"Expected file not found: {os.path.relpath(path, base_path)}")
+
+def parse_refined_output(refined_output):
+    # One pass over the output picks up the first project name, the first folder
+    # structure and every code block
+    project_name = None
+    folder_structure_text = None
+    code_blocks = []
+    for match in _REFINED_OUTPUT_RE.finditer(refined_output):
+        if match.group('filename') is not None:
+            code_blocks.append((match.group('filename'), match.group('language'), match.group('content')))
+        elif match.group('folder_structure') is not None:
+            if folder_structure_text is None:
+                folder_structure_text = match.group('folder_structure')
+        elif project_name is None:
+            project_name = match.group('project_name')
+    return project_name, folder_structure_text, code_blocks
+
+async def write_file(path, content):
+    async with aiofiles.open(path, 'w', encoding='utf-8') as file:
+        await file.write(content)
+
+async def process_objective(objective, file_content, use_search):
     task_exchanges = []
     gpt_tasks = []
 
     while True:
         previous_results = [result for _, result in task_exchanges]
         if not task_exchanges:
-            gpt_result, file_content_for_gpt, search_query = gpt_orchestrator(objective, file_content, previous_results, use_search)
+            gpt_result, file_content_for_gpt, search_query = await gpt_orchestrator(objective, file_content, previous_results, use_search)
         else:
-            gpt_result, _, search_query = gpt_orchestrator(objective, previous_results=previous_results, use_search=use_search)
+            gpt_result, _, search_query = await gpt_orchestrator(objective, previous_results=previous_results, use_search=use_search)
 
         if "The task is complete:" in gpt_result:
             final_output = gpt_result.replace("The task is complete:", "").strip()
             break
         else:
-            sub_task_prompt = gpt_result
-            if file_content_for_gpt and not gpt_tasks:
-                sub_task_prompt = f"{sub_task_prompt}\n\nFile content:\n{file_content_for_gpt}"
-            sub_task_result = gpt_sub_agent(sub_task_prompt, search_query, gpt_tasks, use_search)
-            gpt_tasks.append({"task": sub_task_prompt, "result": sub_task_result})
-            task_exchanges.append((sub_task_prompt, sub_task_result))
+            # Start the search right away; every sub-agent of this round awaits the same task
+            search_task = asyncio.create_task(tavily_qna_search(search_query)) if use_search and search_query else None
+            sub_task_prompts = extract_sub_tasks(gpt_result)
+            batches = [sub_task_prompts[i:i + SUB_TASK_BATCH_SIZE] for i in range(0, len(sub_task_prompts), SUB_TASK_BATCH_SIZE)]
+            batch_results = await asyncio.gather(*[gpt_sub_agent_batch(batch, search_task, gpt_tasks, file_content_for_gpt) for batch in batches])
+            sub_task_results = [result for results in batch_results for result in results]
+            if file_content_for_gpt:
+                # Keep the file in the history once, with the first task that saw it
+                sub_task_prompts[0] = f"{sub_task_prompts[0]}\n\nFile content:\n{file_content_for_gpt}"
+            for sub_task_prompt, sub_task_result in zip(sub_task_prompts, sub_task_results):
+                gpt_tasks.append({"task": sub_task_prompt, "result": sub_task_result})
+                task_exchanges.append((sub_task_prompt, sub_task_result))
             file_content_for_gpt = None
 
     sanitized_objective = sanitize_filename(objective[:50])  # Limit objective length in filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    refined_output = retry_ai_call(anthropic_refine, 3, objective, [result for _, result in task_exchanges], timestamp, sanitized_objective)
+    refined_output = await retry_ai_call(anthropic_refine, 3, objective, [result for _, result in task_exchanges], timestamp, sanitized_objective)
 
-    project_name_match = re.search(r'Project Name: (.*)', refined_output)
-    project_name = project_name_match.group(1).strip() if project_name_match else sanitized_objective
-    project_name = sanitize_filename(project_name)
+    project_name, folder_structure_text, code_blocks = parse_refined_output(refined_output)
+    project_name = sanitize_filename(project_name.strip() if project_name is not None else sanitized_objective)
 
     # Create the project directory
     project_dir = os.path.join(os.getcwd(), project_name)
     os.makedirs(project_dir, exist_ok=True)
+    created_dirs = {project_dir}
 
     # Extract folder structure and create directories
-    folder_structure_match = re.search(r'<folder_structure>(.*?)</folder_structure>', refined_output, re.DOTALL)
-    if folder_structure_match:
+    if folder_structure_text is not None:
         try:
-            folder_structure = json.loads(folder_structure_match.group(1))
-            create_folder_structure(project_dir, folder_structure)
+            folder_structure = load_folder_structure(folder_structure_text)
+            if isinstance(folder_structure, dict):
+                created_dirs |= create_folder_structure(project_dir, folder_structure)
+            else:
+                logging.error("Folder structure is not a JSON object")
         except json.JSONDecodeError:
             logging.error("Invalid folder structure JSON")
 
-    # Extract code blocks and create files
-    code_blocks = re.findall(r'Filename:\s*`?(\S+)`?\s*```(\w*)\n(.*?)\n```', refined_output, re.DOTALL)
-    created_files = []
+    # Write the extracted code blocks concurrently
+    prepared_files = {}  # a later block for the same file wins, as when writing sequentially
     for filename, language, content in code_blocks:
         filename = sanitize_filename(filename.strip('`'))
         file_path = os.path.join(project_dir, filename)
         content = content.strip()
         if validate_code(filename, content):
-            try:
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, 'w', encoding='utf-8') as file:
-                    file.write(content)
-                logging.info(f"File created: {file_path}")
-                created_files.append(os.path.relpath(file_path, project_dir))
-            except Exception as e:
-                logging.error(f"Error writing file {filename}: {str(e)}")
+            prepared_files[file_path] = content
         else:
             logging.error(f"Invalid code content for {filename}")
 
+    # Create each missing parent directory once, skipping the ones created above. makedirs
+    # creates all ancestors, so only the deepest directories need a call
+    parent_dirs = {os.path.dirname(file_path) for file_path in prepared_files} - created_dirs
+    for parent_dir in sorted(parent_dirs - {os.path.dirname(path) for path in parent_dirs}):
+        try:
+            os.makedirs(parent_dir, exist_ok=True)
+        except OSError as e:
+            logging.error(f"Error creating directory {parent_dir}: {str(e)}")
+
+    write_errors = await asyncio.gather(*[write_file(file_path, content) for file_path, content in prepared_files.items()], return_exceptions=True)
+    created_files = []
+    for file_path, error in zip(prepared_files, write_errors):
+        if error is None:
+            logging.info(f"File created: {file_path}")
+            created_files.append(os.path.relpath(file_path, project_dir))
+        else:
+            logging.error(f"Error writing file {os.path.basename(file_path)}: {str(error)}")
+
     # Create the log file
     log_filename = f"{timestamp}_{sanitized_objective}.md"
     log_path = os.path.join(project_dir, log_filename)
-    with open(log_path, 'w', encoding='utf-8') as log_file:
-        log_file.write(f"# Project: {project_name}\n\n")
-        log_file.write(f"## Objective\n{objective}\n\n")
-        log_file.write("## Task Breakdown\n\n")
-        for i, (prompt, result) in enumerate(task_exchanges, start=1):
-            log_file.write(f"### Task {i}\n")
-            log_file.write(f"**Prompt:** {prompt}\n\n")
-            log_file.write(f"**Result:** {result}\n\n")
-        log_file.write("## Refined Final Output\n\n")
-        log_file.write(refined_output)
-        log_file.write("\n\n## Created Files\n\n")
-        for created_file in created_files:
-            log_file.write(f"- {created_file}\n")
+    log_parts = [
+        f"# Project: {project_name}\n\n",
+        f"## Objective\n{objective}\n\n",
+        "## Task Breakdown\n\n"
+    ]
+    for i, (prompt, result) in enumerate(task_exchanges, start=1):
+        log_parts.append(f"### Task {i}\n**Prompt:** {prompt}\n\n**Result:** {result}\n\n")
+    log_parts.append(f"## Refined Final Output\n\n{refined_output}\n\n## Created Files\n\n")
+    log_parts.extend(f"- {created_file}\n" for created_file in created_files)
+    await write_file(log_path, "".join(log_parts))
 
     console.print(f"\n[bold]Project created:[/bold] {project_name}")
     console.print(f"[bold]Files created:[/bold] {', '.join(created_files)}")
@@ -488,11 +830,13 @@ def process_objective(objective, file_content, use_search):
     }
 
 def create_folder_structure(base_path, structure):
-    for name, content in structure.items():
-        path = os.path.join(base_path, name)
-        if content is None:  # It's a file
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            open(path, 'a').close()  # Create an empty file
-        else:  # It's a directory
-            os.makedirs(path, exist_ok=True)
-            create_folder_structure(path, content)
+    dirs, files = [], []
+    flatten_folder_structure(structure, base_path, dirs, files)
+    # makedirs creates all ancestors, so only the deepest directories need a call
+    needed_dirs = set(dirs) | {os.path.dirname(path) for path in files}
+    leaf_dirs = needed_dirs - {os.path.dirname(path) for path in needed_dirs}
+    for path in sorted(leaf_dirs):
+        os.makedirs(path, exist_ok=True)
+    for path in files:
+        open(path, 'a').close()  # Create an empty file
+    return needed_dirs
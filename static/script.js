@@ -7,27 +7,35 @@ document.addEventListener('DOMContentLoaded', () => {
     const downloadLinks = document.getElementById('downloadLinks');
     const tabButtons = document.querySelectorAll('.tab-btn');
     const tabContents = document.querySelectorAll('.tab-content');
+    const progressPre = document.getElementById('progress');
 
     form.addEventListener('submit', async (e) => {
         e.preventDefault();
         
         const formData = new FormData(form);
+        const payload = {
+            objective: formData.get('objective'),
+            use_search: formData.get('use_search') === 'true'
+        };
         
         // Show loading spinner and hide result
         loadingDiv.classList.remove('hidden');
         resultDiv.classList.add('hidden');
+        progressPre.textContent = '';
 
         try {
             const response = await fetch('/process', {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
             });
 
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
 
-            const data = await response.json();
+            const { job_id } = await response.json();
+            const data = await waitForJob(job_id);
             
             // Display result
             outputPre.textContent = data.refined_output;
@@ -60,6 +68,51 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    async function waitForJob(jobId) {
+        // Show the generated text as it streams in while the job runs. Several calls stream
+        // at the same time, so each call's text goes into its own block.
+        const progressBlocks = new Map();
+        const events = new EventSource(`/stream/${jobId}`);
+        events.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (message.done) {
+                events.close();
+                return;
+            }
+            let block = progressBlocks.get(message.stream);
+            if (!block) {
+                block = document.createTextNode('');
+                progressBlocks.set(message.stream, block);
+                progressPre.appendChild(block);
+            }
+            if (message.reset) {
+                block.data = '';
+            } else {
+                block.data += message.text;
+            }
+            progressPre.scrollTop = progressPre.scrollHeight;
+        };
+
+        try {
+            while (true) {
+                const response = await fetch(`/status/${jobId}`);
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                const status = await response.json();
+                if (status.status === 'complete') {
+                    return status.result;
+                }
+                if (status.status === 'failed') {
+                    throw new Error(status.error);
+                }
+                await new Promise(resolve => setTimeout(resolve, 2000));
+            }
+        } finally {
+            events.close();
+        }
+    }
+
     function addDownloadLink(file, label) {
         const link = document.createElement('a');
         link.href = `/download/${encodeURIComponent(file)}`;
@@ -0,0 +1,38 @@
+import os
+import json
+from job_queue import REDIS_SETTINGS, stream_channel
+from main import process_objective, aclient, stream_callback
+
+async def run_process_objective(ctx, objective, file_content, use_search):
+    redis = ctx['redis']
+    channel = stream_channel(ctx['job_id'])
+
+    async def publish_delta(stream_id, text):
+        if text is None:
+            # The call is being retried; the client drops what it has shown for this stream
+            await redis.publish(channel, json.dumps({'stream': stream_id, 'reset': True}))
+        else:
+            await redis.publish(channel, json.dumps({'stream': stream_id, 'text': text}))
+
+    token = stream_callback.set(publish_delta)
+    try:
+        result = await process_objective(objective, file_content, use_search)
+    finally:
+        stream_callback.reset(token)
+        await redis.publish(channel, json.dumps({'done': True}))
+
+    # Update file paths to be relative to the current working directory
+    result['log_file'] = os.path.join(result['project_name'], os.path.basename(result['log_file']))
+    result['created_files'] = [os.path.join(result['project_name'], file) for file in result['created_files']]
+
+    return result
+
+async def shutdown(ctx):
+    # Close the shared OpenAI connection pool
+    await aclient.close()
+
+class WorkerSettings:
+    functions = [run_process_objective]
+    redis_settings = REDIS_SETTINGS
+    on_shutdown = shutdown
+    job_timeout = 30 * 60